@@ -1,4 +1,6 @@
-COMPANY_NAMES = {
+import sys
+
+_RAW_COMPANY_NAMES = {
     "PSO"       : "Pakistan State Oil",
     "OGDC"      : "Oil & Gas Development Company Limited",
     "PPL"       : "Pakistan Petroleum Limited",
@@ -611,3 +613,6 @@ COMPANY_NAMES = {
     "SRVI": "Service Ind.Ltd"
 
 }
+
+# Built once at import with interned keys, so lookups by symbol compare by identity first
+COMPANY_NAMES = {sys.intern(symbol): name for symbol, name in _RAW_COMPANY_NAMES.items()}
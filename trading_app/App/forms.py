@@ -2,9 +2,64 @@
 #                                 forms.py                                       
 # -------------------------------------------------------------------------------
 
+import time
+from functools import lru_cache
+
 from django import forms
 from .models import Stock, Trade
 
+# How long (seconds) the stock dropdown choices are reused before reloading
+STOCK_CHOICES_TTL = 60
+
+
+@lru_cache(maxsize=4)
+def _stock_choices(version, time_bucket):
+    """
+    Load (pk, symbol) pairs for the stock dropdown.
+    version and time_bucket are only used as the cache key.
+    """
+    return tuple(Stock.objects.order_by("symbol").values_list("pk", "symbol"))
+
+
+def _number_input(**attrs):
+    """
+    NumberInput with the shared bootstrap class and a 2 decimal place step.
+    Extra keyword arguments are added to the widget attrs.
+    """
+    return forms.NumberInput(attrs={"class": "form-control", "step": "0.01", **attrs})
+
+
+class CachedStockChoiceIterator(forms.models.ModelChoiceIterator):
+    """
+    Yields the stock <option> list from the per-process cache instead of
+    iterating the queryset. Evaluated lazily, at render time.
+    """
+
+    def _cached(self):
+        return _stock_choices(Stock.choices_version, int(time.time() // STOCK_CHOICES_TTL))
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        yield from self._cached()
+
+    def __len__(self):
+        return len(self._cached()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self._cached())
+
+
+class CachedStockChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField for stocks whose <option> list is cached per process.
+    The cache is dropped when a Stock is saved/deleted in this process and
+    at least every STOCK_CHOICES_TTL seconds (for changes made by other processes).
+    Validation still goes through the queryset.
+    """
+
+    iterator = CachedStockChoiceIterator
+
 
 class StockForm(forms.ModelForm):
     class Meta:
@@ -23,57 +78,16 @@ class StockForm(forms.ModelForm):
                 "placeholder": "add stock name",
                 "autocomplete": "off"
             }),
-            "current_price": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_current_price",
-                "step": "0.01",
-                "readonly": True,
-            }),
-            "high": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_high",
-                "step": "0.01"
-            }),
-            "low": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_low",
-                "step": "0.01"
-            }),
-            "rsi": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_rsi",
-                "step": "0.01"
-            }),
-            "tp1": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_tp1",
-                "step": "0.01"
-            }),
-            "tp2": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_tp2",
-                "step": "0.01"
-            }),
-            "tp3": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_tp3",
-                "step": "0.01"
-            }),
-            "sl1": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_sl1",
-                "step": "0.01"
-            }),
-            "sl2": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_sl2",
-                "step": "0.01"
-            }),
-            "sl3": forms.NumberInput(attrs={
-                "class": "form-control",
-                "id": "id_sl3",
-                "step": "0.01"
-            }),
+            "current_price": _number_input(id="id_current_price", readonly=True),
+            "high": _number_input(id="id_high"),
+            "low": _number_input(id="id_low"),
+            "rsi": _number_input(id="id_rsi"),
+            "tp1": _number_input(id="id_tp1"),
+            "tp2": _number_input(id="id_tp2"),
+            "tp3": _number_input(id="id_tp3"),
+            "sl1": _number_input(id="id_sl1"),
+            "sl2": _number_input(id="id_sl2"),
+            "sl3": _number_input(id="id_sl3"),
         }
 
 
@@ -89,6 +103,9 @@ class TradeForm(forms.ModelForm):
             "msl",
             "comments",
         ]
+        field_classes = {
+            "stock": CachedStockChoiceField,
+        }
         widgets = {
             "stock": forms.Select(attrs={
                 "class": "form-select",
@@ -98,25 +115,13 @@ class TradeForm(forms.ModelForm):
                 "class": "form-control",
                 "min": "1"
             }),
-            "buying_price": forms.NumberInput(attrs={
-                "class": "form-control",
-                "step": "0.01",
-                "min": "0"
-            }),
+            "buying_price": _number_input(min="0"),
             "buy_date": forms.DateInput(attrs={
                 "type": "date",
                 "class": "form-control"
             }),
-            "mtp": forms.NumberInput(attrs={
-                "class": "form-control",
-                "step": "0.01",
-                "min": "0"
-            }),
-            "msl": forms.NumberInput(attrs={
-                "class": "form-control",
-                "step": "0.01",
-                "min": "0"
-            }),
+            "mtp": _number_input(min="0"),
+            "msl": _number_input(min="0"),
             "comments": forms.Textarea(attrs={
                 "class": "form-control",
                 "rows": "3",
@@ -124,6 +129,11 @@ class TradeForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only used to validate the submitted stock, so don't load every Stock column
+        self.fields["stock"].queryset = Stock.objects.only("id", "symbol").order_by("symbol")
+
     def clean_quantity(self):
         quantity = self.cleaned_data.get("quantity")
         if quantity is None or quantity <= 0:
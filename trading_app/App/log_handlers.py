@@ -0,0 +1,22 @@
+# -------------------------------------------------------#
+#-------------------- log_handlers.py -------------------#
+# -------------------------------------------------------#
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class BackgroundStreamHandler(QueueHandler):
+    """
+    Log handler that only puts records on a queue; a background thread
+    writes them to stderr. Request threads never block on the stream.
+    Used from settings.LOGGING.
+    """
+
+    def __init__(self):
+        log_queue = queue.SimpleQueue()
+        super().__init__(log_queue)
+        self.listener = QueueListener(log_queue, logging.StreamHandler())
+        self.listener.start()
+        atexit.register(self.listener.stop)
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.22 on 2026-10-15 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0002_alter_stock_current_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user', 'stock'], name='App_trade_user_id_3f66cd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user', 'buy_date'], name='App_trade_user_id_b59d83_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user', 'created_at'], name='App_trade_user_id_1e4cb0_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.22 on 2026-10-15 11:02
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, When
+from django.db.models.functions import Round
+from django.db.models.lookups import GreaterThan
+
+
+def populate_pl_percent(apps, schema_editor):
+    """Fill pl_percent for existing trades (same formula as Trade.recompute_fields)."""
+    Stock = apps.get_model('App', 'Stock')
+    Trade = apps.get_model('App', 'Trade')
+    price = Subquery(Stock.objects.filter(pk=OuterRef('stock_id')).values('current_price')[:1])
+    Trade.objects.exclude(buying_price=0).update(
+        pl_percent=Case(
+            When(GreaterThan(price, 0), then=Round((price - F('buying_price')) * 100 / F('buying_price'), 2)),
+            default=None,
+            output_field=models.DecimalField(max_digits=7, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0003_trade_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='pl_percent',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True),
+        ),
+        migrations.RunPython(populate_pl_percent, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.22 on 2026-10-15 11:13
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, When
+from django.db.models.lookups import GreaterThan
+
+
+def populate_unrealized_pl(apps, schema_editor):
+    """Fill unrealized_pl for existing trades (same formula as Trade.recompute_fields)."""
+    Stock = apps.get_model('App', 'Stock')
+    Trade = apps.get_model('App', 'Trade')
+    price = Subquery(Stock.objects.filter(pk=OuterRef('stock_id')).values('current_price')[:1])
+    Trade.objects.update(
+        unrealized_pl=Case(
+            When(GreaterThan(price, 0), then=(price - F('buying_price')) * F('quantity')),
+            default=None,
+            output_field=models.DecimalField(max_digits=15, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0004_trade_pl_percent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='unrealized_pl',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user', 'unrealized_pl'], name='App_trade_user_id_57be1a_idx'),
+        ),
+        migrations.RunPython(populate_unrealized_pl, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.22 on 2026-10-15 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0005_trade_unrealized_pl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
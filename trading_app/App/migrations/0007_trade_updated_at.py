@@ -0,0 +1,18 @@
+# Generated by Django 4.2.22 on 2026-10-15 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0006_stock_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -1,9 +1,27 @@
 # --------------------------------------------------------#
 #------------------------ models.py-----------------------#
 # --------------------------------------------------------#
+from decimal import Context, Decimal, ROUND_HALF_UP
+from functools import cached_property
+
 from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, OuterRef, Q, Subquery, When
+from django.db.models.functions import Round
+from django.db.models.lookups import GreaterThan, LessThan
 from django.contrib.auth.models import User
 
+# Shared context for rounding money/percent values to 2 decimal places
+# (quantize with a fixed context is cheaper than round(Decimal, 2))
+_CTX = Context(prec=12, rounding=ROUND_HALF_UP)
+_Q2 = Decimal("0.01")
+
+
+def _round2(value):
+    """Round to 2 decimal places. Also accepts the float that int / int gives."""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(_Q2, context=_CTX)
+
 # Create your models here.
 
 class Stock(models.Model):
@@ -15,6 +33,8 @@ class Stock(models.Model):
     change = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     change_percent = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     volume = models.BigIntegerField(null=True, blank=True)
+    # Last save of this row (price refreshes set it explicitly, since bulk_update skips auto_now)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     # Take Profits
     tp1 = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -40,9 +60,112 @@ class Stock(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Bumped whenever a stock is added, edited or deleted so cached
+    # stock dropdown choices (see forms.CachedStockChoiceField) are rebuilt
+    choices_version = 0
+
     def __str__(self):
         return self.symbol
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        Stock.choices_version += 1
+        if not adding:
+            # The price may have changed, refresh the stored P/L of this stock's trades in one query
+            Trade.recompute_bulk(self.trade_set.all())
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Stock.choices_version += 1
+        return result
+
+
+class TradeQuerySet(models.QuerySet):
+    def update_metrics(self):
+        """
+        Recalculate the computed P/L columns of every trade in this queryset
+        with a single UPDATE statement.
+
+        The database evaluates the same rules as Trade.recompute_fields(),
+        so no trade has to be loaded into Python. Returns the number of rows updated.
+        """
+        # Current market price of the trade's stock (UPDATE cannot follow joins, so use a subquery)
+        price = Subquery(Stock.objects.filter(pk=OuterRef("stock_id")).values("current_price")[:1])
+
+        # Mirror the "if self.mtp:" style truthiness checks (set and not zero)
+        has_mtp = Q(mtp__isnull=False) & ~Q(mtp=0)
+        has_msl = Q(msl__isnull=False) & ~Q(msl=0)
+        has_buying_price = ~Q(buying_price=0)
+        has_price = GreaterThan(price, 0)
+
+        amount = models.DecimalField(max_digits=10, decimal_places=2)
+        percent = models.DecimalField(max_digits=5, decimal_places=2)
+
+        return self.update(
+            profit_expected=Case(
+                When(has_mtp, then=(F("mtp") - F("buying_price")) * F("quantity")),
+                default=None, output_field=amount,
+            ),
+            profit_percent=Case(
+                When(has_mtp & has_buying_price,
+                     then=Round((F("mtp") - F("buying_price")) * 100 / F("buying_price"), 2)),
+                default=None, output_field=percent,
+            ),
+            loss_expected=Case(
+                When(has_msl, then=(F("buying_price") - F("msl")) * F("quantity")),
+                default=None, output_field=amount,
+            ),
+            pl_ratio=Case(
+                When(has_mtp & has_msl & has_buying_price & Q(msl__lt=F("buying_price")),
+                     then=Round((F("mtp") - F("buying_price")) / (F("buying_price") - F("msl")), 2)),
+                default=None, output_field=percent,
+            ),
+            rate_difference=Case(
+                When(has_price, then=price - F("buying_price")),
+                default=None, output_field=amount,
+            ),
+            pl_percent=Case(
+                When(has_price & has_buying_price,
+                     then=Round((price - F("buying_price")) * 100 / F("buying_price"), 2)),
+                default=None, output_field=models.DecimalField(max_digits=7, decimal_places=2),
+            ),
+            loss_recent=Case(
+                When(has_msl & has_price & LessThan(price, F("buying_price")),
+                     then=(F("buying_price") - price) * F("quantity")),
+                default=None, output_field=amount,
+            ),
+            unrealized_pl=Case(
+                When(has_price, then=(price - F("buying_price")) * F("quantity")),
+                default=None, output_field=models.DecimalField(max_digits=15, decimal_places=2),
+            ),
+        )
+
+    def with_values(self):
+        """
+        Annotate total_cost and current_value (same rules as the Trade
+        properties of the same name) so templates read values computed by
+        the database instead of doing Decimal math per row.
+        unrealized_pl is a stored column, so it needs no annotation.
+        """
+        money = models.DecimalField(max_digits=15, decimal_places=2)
+        total_cost = ExpressionWrapper(F("quantity") * F("buying_price"), output_field=money)
+        current_value = Case(
+            When(stock__current_price__gt=0, then=F("quantity") * F("stock__current_price")),
+            default=None, output_field=money,
+        )
+        return self.annotate(total_cost=total_cost, current_value=current_value)
+
+
+class TradeManager(models.Manager.from_queryset(TradeQuerySet)):
+    def get_queryset(self):
+        """
+        Always join the stock and user of a trade.
+        __str__, current_price and the templates read them for every row,
+        so this avoids one extra query per trade (N+1).
+        """
+        return super().get_queryset().select_related("stock", "user")
+
 
 class Trade(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -67,7 +190,9 @@ class Trade(models.Model):
 
     # Calculations
     rate_difference = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
-    pl_percent = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    pl_percent = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)
+    # Stored (not a property) so the dashboard sorts by profit/loss without computing it per row
+    unrealized_pl = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
 
     # Notes
     comments = models.TextField(blank=True)
@@ -77,60 +202,64 @@ class Trade(models.Model):
     min_profit_loss = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last edit of this trade (the dashboard's ETag, see views._dashboard_etag)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    objects = TradeManager()
+
+    class Meta:
+        # Stock.symbol needs no extra index here: unique=True already creates one,
+        # which serves the dashboard's symbol filter and sort through the stock join
+        indexes = [
+            models.Index(fields=["user", "stock"]),       # Portfolio filtered by user and joined to stock
+            models.Index(fields=["user", "buy_date"]),    # Dashboard "date" sort (read backwards for newest first)
+            models.Index(fields=["user", "created_at"]),  # Trade list, newest first
+            # Dashboard "profit" / "loss" sorts. Only narrows the scan to the user's rows on MySQL:
+            # it has no NULLS LAST, so Django sorts on "unrealized_pl IS NULL, unrealized_pl"
+            models.Index(fields=["user", "unrealized_pl"]),
+        ]
 
     def __str__(self):
         return f"{self.stock.symbol} - {self.user.username}"
 
-    @property
+    # total_cost and current_value are cached_property so that
+    # TradeQuerySet.with_values() annotations (computed by the DB) take their place
+
+    @cached_property
     def total_cost(self):
         """Calculate total cost of the trade (quantity * buying_price)."""
         return self.quantity * self.buying_price
 
-    @property
+    @cached_property
     def current_price(self):
-        """Get current market price from associated stock."""
+        """
+        Get current market price from associated stock.
+        Cached on the instance, since every value/P&L property reads it.
+        """
         return self.stock.current_price if self.stock else None
 
-    @property
+    @cached_property
     def current_value(self):
         """Calculate current value of the trade (quantity * current_price)."""
         if self.current_price:
             return self.quantity * self.current_price
         return None
 
-    @property
-    def unrealized_pl(self):
+    def recompute_fields(self):
         """
-        'pl' 'profit and loss'.
-        This property computes the unrealized profit or loss of the trade.
-       
-        Formula: (current market price * quantity) - (buying price * quantity)
-        i.e. unrealized_pl = current_value - total_cost
-        """
-        if self.current_value is not None:
-            return self.current_value - self.total_cost
-        return None 
-
-    @property
-    def pl_percent(self):
-        """Calculate profit/loss percentage."""
-        if self.total_cost and self.unrealized_pl is not None:
-            return round((self.unrealized_pl / self.total_cost) * 100, 2)
-        return 0
+        Calculate the profit and loss related fields on this instance
+        without touching the database.
 
-    def save(self, *args, **kwargs):
-        """
-        Override the save method to automatically calculate 
-        profit and loss related fields whenever the model is saved.
-        
         This method updates several attributes such as:
         - profit_expected
         - profit_percent
         - loss_expected
         - pl_ratio
         - rate_difference
+        - pl_percent
         - loss_recent
-        
+        - unrealized_pl
+
         The calculation depends on fields like:
         - self.mtp (Maximum Target Price)
         - self.msl (Maximum Stop Loss)
@@ -138,19 +267,25 @@ class Trade(models.Model):
         - self.quantity
         - self.current_price (property, not a field)
         """
-        
+
+        # The stock (or its price) may have changed since current_price was cached
+        self.__dict__.pop("current_price", None)
+
+        # Convert quantity once instead of coercing the int in every multiplication
+        quantity = Decimal(self.quantity)
+
         # --- PROFIT EXPECTED ---
         # If the field "mtp" (Maximum Target Price) is set (not None, not 0, not empty)
         if self.mtp:
             # Calculate expected profit: (mtp - buying_price) * quantity
             # mtp is the price at which you plan to sell for maximum profit
-            self.profit_expected = (self.mtp - self.buying_price) * self.quantity
+            self.profit_expected = (self.mtp - self.buying_price) * quantity
             
             # Next, calculate the percent profit.
             # This shows how much percentage return you make if you sell at mtp.
             if self.buying_price:
                 # Formula: ((mtp - buying_price) / buying_price) * 100 (rounded to 2 decimal places)
-                self.profit_percent = round(((self.mtp - self.buying_price) / self.buying_price) * 100, 2)
+                self.profit_percent = _round2(((self.mtp - self.buying_price) / self.buying_price) * 100)
             else:
                 # If buying price is zero/not set, can't calculate percent.
                 self.profit_percent = None
@@ -164,7 +299,7 @@ class Trade(models.Model):
         if self.msl:
             # Calculate the maximum loss if price falls to msl and you exit:
             # (buying_price - msl) * quantity
-            self.loss_expected = (self.buying_price - self.msl) * self.quantity
+            self.loss_expected = (self.buying_price - self.msl) * quantity
         else:
             # If not set, no loss expected can be calculated
             self.loss_expected = None
@@ -185,7 +320,7 @@ class Trade(models.Model):
             if loss_per_share > 0:
                 # The profit-to-loss ratio: how much potential profit vs potential loss
                 # For example, 2 means your possible profit is twice the possible loss
-                self.pl_ratio = round(profit_per_share / loss_per_share, 2)
+                self.pl_ratio = _round2(profit_per_share / loss_per_share)
             else:
                 # If you'd not lose money (maybe msl >= buying_price), ratio is undefined
                 self.pl_ratio = None
@@ -202,13 +337,22 @@ class Trade(models.Model):
             # If no current price, leave blank (None)
             self.rate_difference = None
 
+        # --- P/L PERCENT ---
+        # Unrealized profit/loss as a percentage of what you paid
+        if self.current_price and self.buying_price:
+            # Formula: ((current_price - buying_price) / buying_price) * 100 (rounded to 2 decimal places)
+            self.pl_percent = _round2(((self.current_price - self.buying_price) / self.buying_price) * 100)
+        else:
+            # Without a current price (or buy price) there is no unrealized P/L yet
+            self.pl_percent = None
+
         # --- RECENT LOSS ---
         # If you set a stop loss and current price exists:
         if self.msl and self.current_price:
             # If the current price is lower than your buy price, there is an unrealized loss
             if self.current_price < self.buying_price:
                 # Calculate how much you'd lose if sold now (it hasn't hit msl, but is below buy)
-                self.loss_recent = (self.buying_price - self.current_price) * self.quantity
+                self.loss_recent = (self.buying_price - self.current_price) * quantity
             else:
                 # If price didn't go below buying, no unrealized recent loss
                 self.loss_recent = None
@@ -216,9 +360,39 @@ class Trade(models.Model):
             # If you didn't set msl, or don't have current price, cannot compute recent loss
             self.loss_recent = None
 
+        # --- UNREALIZED P/L ---
+        # (current market price * quantity) - (buying price * quantity),
+        # i.e. current_value - total_cost; stored so the dashboard can sort on it
+        if self.current_price:
+            self.unrealized_pl = (self.current_price - self.buying_price) * quantity
+        else:
+            # No market price yet, so nothing to compare against
+            self.unrealized_pl = None
+
         # NOTE:
         # Fields like max_profit and min_profit_loss require historical data (price history)
         # so these are not calculated automatically here.
 
+    def save(self, *args, **kwargs):
+        """
+        Override the save method to automatically calculate
+        profit and loss related fields whenever the model is saved.
+        See recompute_fields() for the calculations.
+        """
+        self.recompute_fields()
+
         # Finally, call the original save method to update the object in the database
         super().save(*args, **kwargs)
+
+    @classmethod
+    def recompute_bulk(cls, queryset=None):
+        """
+        Recalculate the computed fields for many trades at once.
+
+        All rows are written by one UPDATE (see TradeQuerySet.update_metrics)
+        instead of one save() per trade.
+        Returns the number of trades recomputed.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+        return queryset.update_metrics()
@@ -0,0 +1,49 @@
+# -------------------------------------------------------#
+#--------------------- paginators.py --------------------#
+# -------------------------------------------------------#
+import hashlib
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+
+class FastPaginator(Paginator):
+    """
+    Paginator that reads a page in two steps:
+    1. the primary keys of the page (OFFSET/LIMIT over the index only)
+    2. the full rows for just those keys
+
+    With a plain OFFSET the database reads and throws away every full row
+    before the page; here it only skips index entries, so deep pages stay cheap.
+    Works with ordered querysets (the ordering is applied to both steps).
+    """
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+
+        pks = list(self.object_list.values_list("pk", flat=True)[bottom:top])
+        return self._get_page(list(self.object_list.filter(pk__in=pks)), number, self)
+
+
+class CachingPaginator(FastPaginator):
+    """
+    FastPaginator whose total count (SELECT COUNT(*)) is kept in the Django
+    cache for COUNT_CACHE_TTL seconds, keyed by the queryset's SQL.
+    New/deleted rows may take up to that long to change the page count.
+    """
+
+    COUNT_CACHE_TTL = 60
+
+    @cached_property
+    def count(self):
+        key = "pg:" + hashlib.sha1(str(self.object_list.query).encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, self.COUNT_CACHE_TTL)
+        return count
@@ -0,0 +1,26 @@
+# -------------------------------------------------------#
+#--------------------- responses.py ---------------------#
+# -------------------------------------------------------#
+from decimal import Decimal
+
+import orjson  # Serializes much faster than the stdlib json used by JsonResponse
+from django.http import HttpResponse
+
+
+def _default(obj):
+    """
+    orjson has no Decimal support, so model values are sent as JSON numbers.
+    """
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonResponse(HttpResponse):
+    """
+    Drop-in replacement for JsonResponse that encodes the data with orjson.
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(orjson.dumps(data, default=_default), **kwargs)
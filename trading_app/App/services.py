@@ -1,58 +1,263 @@
 from .company_names import COMPANY_NAMES
+import asyncio
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+
+import httpx  # Async HTTP client, used to fetch many symbols concurrently over HTTP/2
+import orjson  # Faster JSON parser than the stdlib json used by response.json()
 import requests  # Import the requests library for making HTTP requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# How long (seconds) a fetched quote is kept in the Django cache before hitting the API again
+CACHE_TTL = 30
+
+# Max number of open connections used by afetch_stock_from_psx_bulk
+MAX_CONNECTIONS = 32
 
-def fetch_stock_from_psx(symbol):
+PSX_BASE_URL = "https://psxterminal.com"
+
+# Prepare HTTP headers to mimic a real browser (helps prevent being blocked by API)
+HEADERS = {
+    "User-Agent": "Mozilla/5.0",            # Identify as a Mozilla browser
+    "Accept": "application/json",           # Request a JSON response
+    "Referer": "https://psxterminal.com/",  # Set referer to API's main site
+}
+
+# Circuit breaker: after this many consecutive API failures, stop calling the API ...
+BREAKER_THRESHOLD = 5
+# ... for this many seconds (unless the API sent a Retry-After header)
+BREAKER_COOLDOWN = 30
+# Longest Retry-After we honor, so one odd header can't switch the API off for hours
+MAX_RETRY_AFTER = 60
+
+
+class CircuitBreaker:
+    """
+    Process-wide circuit breaker for the PSX API.
+    While open, fetches return None immediately instead of waiting for
+    another timeout or rate-limit response.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        return time.monotonic() < self.open_until
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            self.failures += 1
+            now = time.monotonic()
+            if retry_after:
+                # The API told us how long to back off, honor it
+                self.open_until = max(self.open_until, now + retry_after)
+            elif self.failures >= self.threshold:
+                self.open_until = now + self.cooldown
+
+
+_BREAKER = CircuitBreaker()
+
+# One shared session so TCP/TLS connections to the API are reused between calls
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    # Retry connection errors only: 429/5xx go straight to the circuit breaker
+    # instead of urllib3 sleeping out Retry-After inside the request
+    max_retries=Retry(total=2, backoff_factor=0.2, status=0, respect_retry_after_header=False),
+))
+
+
+def fetch_stock_from_psx(symbol, refresh=False):
     """
     Fetch live stock data from PSX Terminal API.
+    Results are cached for CACHE_TTL seconds per symbol;
+    pass refresh=True to skip the cache and always call the API.
     """
     # If symbol is empty or None, return None immediately
     if not symbol:
         return None
 
-    # Construct the PSX Terminal API endpoint URL using the provided stock symbol (convert to uppercase)
-    url = f"https://psxterminal.com/api/ticks/REG/{symbol.upper()}"
+    if not refresh:
+        market_data = cache.get(_cache_key(symbol))
+        if market_data is not None:
+            return market_data
 
-    # Prepare HTTP headers to mimic a real browser (helps prevent being blocked by API)
-    headers = {
-        "User-Agent": "Mozilla/5.0",            # Identify as a Mozilla browser
-        "Accept": "application/json",           # Request a JSON response
-        "Referer": "https://psxterminal.com/",  # Set referer to API's main site
-    }
+    market_data = _fetch_stock(symbol)
+    if market_data is not None:  # Don't cache failures, the circuit breaker handles those
+        cache.set(_cache_key(symbol), market_data, CACHE_TTL)
+    return market_data
+
+
+async def afetch_stock_from_psx_bulk(symbols, refresh=False):
+    """
+    Fetch live stock data for many symbols concurrently.
+    Cached symbols are served from the cache (unless refresh=True); the rest
+    share one HTTP/2 connection pool, so the total time is roughly one round
+    trip instead of one per symbol.
+    Returns a dict of symbol -> market data (None if the fetch failed).
+    """
+    symbols = list(dict.fromkeys(s for s in symbols if s))  # Drop empties and duplicates, keep order
+    if not symbols:
+        return {}
+
+    results = {}
+    if not refresh:
+        cached = await cache.aget_many([_cache_key(s) for s in symbols])
+        results = {s: cached[_cache_key(s)] for s in symbols if _cache_key(s) in cached}
+
+    missing = [s for s in symbols if s not in results]
+    if missing:
+        fetched = await _fetch_many(missing)
+        await cache.aset_many({_cache_key(s): data for s, data in fetched.items() if data is not None}, CACHE_TTL)
+        results.update(fetched)
+
+    return {s: results[s] for s in symbols}  # Keep the caller's order
+
+
+def _cache_key(symbol):
+    return f"psx:{symbol.upper()}"
+
+
+async def fetch_stock_from_psx_async(client, symbol):
+    """
+    Fetch live stock data for one symbol using an httpx.AsyncClient.
+    """
+    # API is failing or rate-limiting us, don't wait for another timeout
+    if _BREAKER.is_open():
+        return None
 
     try:
-        # Send the GET request to the API with the URL, custom headers, and a 10-second timeout
-        response = requests.get(url, headers=headers, timeout=10)
+        response = await client.get(f"/api/ticks/REG/{symbol.upper()}")
 
         # If the response was not successful (status code is not 200 OK), return None
         if response.status_code != 200:
+            _record_bad_status(response)
             return None
 
-        # Parse the response JSON body to a Python dictionary
-        payload = response.json()
+        _BREAKER.record_success()
+        return _parse_payload(symbol, orjson.loads(response.content))
 
-        # Check (validate) if API reported success; if not, return None
-        if not payload.get("success"):
-            return None
+    # If any network, timeout, request or JSON decode error occurs, log a warning and return None
+    except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+        _BREAKER.record_failure()
+        logger.warning("PSX API error for %s: %s", symbol, e)
+        return None
+
+
+async def _fetch_many(symbols):
+    """
+    Run fetch_stock_from_psx_async for all symbols at the same time.
+    """
+    async with httpx.AsyncClient(
+        base_url=PSX_BASE_URL,
+        headers=HEADERS,
+        http2=True,
+        timeout=10,
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS),
+    ) as client:
+        results = await asyncio.gather(
+            *(fetch_stock_from_psx_async(client, s) for s in symbols),
+            return_exceptions=True,  # One failing symbol must not take the others down with it
+        )
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            logger.warning("PSX API error for %s: %s", symbol, result)
+    return {s: None if isinstance(r, Exception) else r for s, r in zip(symbols, results)}
+
+
+def _fetch_stock(symbol):
+    """
+    Do the actual API request for one symbol (no caching).
+    """
+    # Construct the PSX Terminal API endpoint URL using the provided stock symbol (convert to uppercase)
+    url = f"{PSX_BASE_URL}/api/ticks/REG/{symbol.upper()}"
 
-        # Get the "data" field from the API payload (contains the stock info)
-        data = payload.get("data")
-        # If there is no data or no "price" in the data, return None
-        if not data or data.get("price") is None:
+    # API is failing or rate-limiting us, don't wait for another timeout
+    if _BREAKER.is_open():
+        return None
+
+    try:
+        # Send the GET request through the shared session with a 10-second timeout
+        response = _SESSION.get(url, timeout=10)
+
+        # If the response was not successful (status code is not 200 OK), return None
+        if response.status_code != 200:
+            _record_bad_status(response)
             return None
 
-        # Return a dictionary containing the relevant market info fields from API data
-        return {
-            "symbol": symbol,
-            "name": COMPANY_NAMES.get(symbol.upper(), symbol.upper()),  # ✅ FULL NAME
-            "price": data.get("price"),                # Current price of the stock
-            "change": data.get("change"),              # Change in price (absolute)
-            "change_percent": data.get("changePercent"), # Change in price (percent) - note capitalization
-            "volume": data.get("volume"),              # Trading volume
-            "high": data.get("high"),                  # Session high price
-            "low": data.get("low"),                    # Session low price
-        }
-
-    # If any network, timeout, or request error occurs, print error for debugging and return None
-    except requests.RequestException as e:
-        print("PSX API error:", e)
+        _BREAKER.record_success()
+        # Parse the raw response body to a Python dictionary (skips requests' text decoding step)
+        return _parse_payload(symbol, orjson.loads(response.content))
+
+    # If any network, timeout, request or JSON decode error occurs, log a warning and return None
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
+        _BREAKER.record_failure()
+        logger.warning("PSX API error for %s: %s", symbol, e)
         return None
+
+
+def _record_bad_status(response):
+    """
+    Count rate-limit (429) and server error (5xx) responses towards the circuit breaker.
+    Other statuses (e.g. 404 for an unknown symbol) say nothing about the API's health.
+    """
+    if response.status_code == 429 or response.status_code >= 500:
+        _BREAKER.record_failure(_retry_after(response))
+
+
+def _retry_after(response):
+    """
+    Seconds from the Retry-After header (capped at MAX_RETRY_AFTER),
+    or None if missing / not a number.
+    Works for both requests and httpx responses.
+    """
+    try:
+        return min(MAX_RETRY_AFTER, max(0, int(response.headers.get("Retry-After"))))
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_payload(symbol, payload):
+    """
+    Turn a PSX Terminal API payload into our market data dict (None if invalid).
+    """
+    # Check (validate) if API reported success; if not, return None
+    if not isinstance(payload, dict) or not payload.get("success"):
+        return None
+
+    # Get the "data" field from the API payload (contains the stock info)
+    data = payload.get("data")
+    # If there is no data or no "price" in the data, return None
+    if not isinstance(data, dict) or data.get("price") is None:
+        return None
+
+    sym = symbol.upper()  # Upper-case once for the name lookup and its fallback
+
+    # Return a dictionary containing the relevant market info fields from API data
+    return {
+        "symbol": symbol,
+        "name": COMPANY_NAMES.get(sym, sym),  # ✅ FULL NAME
+        "price": data.get("price"),                # Current price of the stock
+        "change": data.get("change"),              # Change in price (absolute)
+        "change_percent": data.get("changePercent"), # Change in price (percent) - note capitalization
+        "volume": data.get("volume"),              # Trading volume
+        "high": data.get("high"),                  # Session high price
+        "low": data.get("low"),                    # Session low price
+    }
@@ -0,0 +1,189 @@
+# -------------------------------------------------------#
+#------------------------ tasks.py ----------------------#
+# -------------------------------------------------------#
+import hashlib
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import ROUND_HALF_UP, Decimal
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+from .models import Stock, Trade
+from .services import afetch_stock_from_psx_bulk
+
+logger = logging.getLogger(__name__)
+
+# Stock columns written from PSX market data
+PRICE_FIELDS = ["current_price", "change", "change_percent", "volume", "high", "low"]
+# Key of each of those columns in the market data from services
+MARKET_KEYS = {"current_price": "price"}
+
+# How long (seconds) a background refresh's status stays readable
+TASK_TTL = 600
+# Background refreshes running at once; later ones wait in the executor's queue
+MAX_RUNNING_TASKS = 2
+# Background refreshes queued or running at once in this process; past it new ones are refused
+MAX_PENDING_TASKS = 8
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_RUNNING_TASKS, thread_name_prefix="stock-refresh")
+_PENDING = threading.BoundedSemaphore(MAX_PENDING_TASKS)
+
+
+async def refresh_stocks(rows):
+    """
+    Fetch and store the latest prices for (pk, symbol) pairs.
+    Returns (updated_stocks, errors) as lists of dicts for the JSON response.
+    """
+    # Fetch latest data for all stocks in parallel; the worker is free while the requests are in flight.
+    # Always past the quote cache: the caller's REFRESH_MIN_AGE check already skips recent stocks,
+    # and a cached quote would be stored (and stamped updated_at) as if it were new
+    market_by_symbol = await afetch_stock_from_psx_bulk([symbol for _, symbol in rows], refresh=True)
+
+    # Build the new prices for each stock
+    updated_stocks = []
+    changed = []
+    errors = []
+    now = timezone.now()
+
+    for pk, symbol in rows:
+        market_data = market_by_symbol.get(symbol)
+
+        if not market_data or market_data.get("price") is None:
+            errors.append({
+                "symbol": symbol,
+                "error": "No data available from API"
+            })
+            continue
+
+        # One bad quote (e.g. a value too large for its column) is reported
+        # for that stock only instead of failing the whole bulk_update
+        try:
+            values = _clean_market_data(market_data)
+        except ValidationError as e:
+            errors.append({
+                "symbol": symbol,
+                "error": "; ".join(e.messages)
+            })
+            continue
+
+        # Unsaved instance carrying just the pk and the columns bulk_update writes
+        changed.append(Stock(pk=pk, updated_at=now, **values))
+
+        # Add to response, straight from the cleaned values (no re-read after bulk_update);
+        # OrjsonResponse writes Decimals as numbers, None becomes null
+        updated_stocks.append({"id": pk, "symbol": symbol, **values})
+
+    if changed:
+        await sync_to_async(_save_refreshed_prices)(changed)
+
+    return updated_stocks, errors
+
+
+def _clean_market_data(market_data):
+    """
+    Convert the market data to the Stock column values.
+    Decimals are rounded half-up to the column's decimal places (the API
+    sends floats, e.g. 546.78), then checked like a form would check them,
+    so only values that really don't fit (max_digits, ranges) are rejected.
+    Raises ValidationError naming the first bad column.
+    """
+    values = {}
+    for name in PRICE_FIELDS:
+        field = Stock._meta.get_field(name)
+        try:
+            value = field.to_python(market_data.get(MARKET_KEYS.get(name, name)))
+            if value is not None and isinstance(field, models.DecimalField):
+                value = value.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+            field.validate(value, None)
+            field.run_validators(value)
+        except ValidationError as e:
+            raise ValidationError([f"{name}: {message}" for message in e.messages])
+        values[name] = value
+    return values
+
+
+def _save_refreshed_prices(changed):
+    """
+    Write the refreshed stocks and their trades' P/L in one transaction.
+    """
+    with transaction.atomic():
+        # Save all refreshed stocks in batches instead of one UPDATE per stock
+        Stock.objects.bulk_update(changed, PRICE_FIELDS + ["updated_at"], batch_size=500)
+        # Recalculate P/L of every trade on the refreshed stocks with a single UPDATE
+        Trade.recompute_bulk(Trade.objects.filter(stock__in=changed))
+
+
+# ------------------------ BACKGROUND REFRESH ------------------------
+
+def start_refresh_task(rows, skipped=()):
+    """
+    Run refresh_stocks() in the background and return a task id right
+    away; poll get_task_status() for the result.
+    A refresh of the same rows that is still pending is reused instead of
+    starting another one. Returns None if too many refreshes are pending.
+    skipped are the response dicts of stocks that were not fetched; they
+    are added to the result's "stocks" as they are.
+    """
+    rows = list(rows)
+    rows_key = _rows_key(rows)
+    task_id = _task_cache().get(rows_key)
+    if task_id and (get_task_status(task_id) or {}).get("status") == "pending":
+        return task_id
+
+    if not _PENDING.acquire(blocking=False):
+        return None
+
+    task_id = uuid.uuid4().hex
+    _task_cache().set(_task_key(task_id), {"status": "pending"}, TASK_TTL)
+    _task_cache().set(rows_key, task_id, TASK_TTL)
+    _EXECUTOR.submit(_run_refresh_task, task_id, rows, list(skipped))
+    return task_id
+
+
+def get_task_status(task_id):
+    """
+    Status dict of a background refresh, or None if unknown / expired.
+    """
+    return _task_cache().get(_task_key(task_id))
+
+
+def _task_cache():
+    # Shared by all worker processes (settings.CACHES), so a poll can land on any of them
+    return caches["tasks"]
+
+
+def _task_key(task_id):
+    return f"refresh-task:{task_id}"
+
+
+def _rows_key(rows):
+    # Same stocks in any order -> same key
+    pks = ",".join(str(pk) for pk in sorted(pk for pk, _ in rows))
+    return "refresh-rows:" + hashlib.sha1(pks.encode()).hexdigest()
+
+
+def _run_refresh_task(task_id, rows, skipped):
+    try:
+        updated_stocks, errors = async_to_sync(refresh_stocks)(rows)
+    except Exception:
+        logger.exception("Background stock refresh %s failed", task_id)
+        _task_cache().set(_task_key(task_id), {"status": "failed"}, TASK_TTL)
+    else:
+        _task_cache().set(_task_key(task_id), {
+            "status": "done",
+            "success": True,
+            "updated": len(updated_stocks),
+            "stocks": updated_stocks + skipped,
+            "skipped": [{"id": stock["id"], "symbol": stock["symbol"]} for stock in skipped],
+            "errors": errors,
+        }, TASK_TTL)
+    finally:
+        _PENDING.release()
+        # This thread opened its own DB connection; don't leave it to the garbage collector
+        connections.close_all()
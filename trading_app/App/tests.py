@@ -1,6 +1,19 @@
 from unicodedata import name
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from unittest import mock
+import httpx
+import threading
+from asgiref.sync import async_to_sync
 from django.test import TestCase
-from . models import Stock
+from django.urls import reverse
+from django.utils import timezone
+from . models import Stock, Trade
+from . forms import TradeForm
+from . paginators import CachingPaginator, FastPaginator
+from . import services
 
 class ModelTesting(TestCase):
     def setUp(self):
@@ -10,4 +23,396 @@ class ModelTesting(TestCase):
         d = self.stock
         self.assertTrue(isinstance(d, Stock))
         self.assertEqual(str(d), "TEST")
-        
\ No newline at end of file
+
+
+class TradeRecomputeTesting(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="trader", password="secret")
+        self.stock = Stock.objects.create(symbol="TEST", name="Test Company", current_price=Decimal("100.00"))
+        self.trade = Trade.objects.create(
+            user=self.user, stock=self.stock, quantity=10,
+            buying_price=Decimal("110.50"), buy_date=date(2026, 1, 1),
+            mtp=Decimal("130.00"), msl=Decimal("100.00"),
+        )
+
+    def test_save_computes_fields(self):
+        self.assertEqual(self.trade.profit_expected, Decimal("195.00"))
+        self.assertEqual(self.trade.profit_percent, Decimal("17.65"))
+        self.assertEqual(self.trade.loss_expected, Decimal("105.00"))
+        self.assertEqual(self.trade.pl_ratio, Decimal("1.86"))
+        self.assertEqual(self.trade.rate_difference, Decimal("-10.50"))
+        self.assertEqual(self.trade.pl_percent, Decimal("-9.50"))
+        self.assertEqual(self.trade.loss_recent, Decimal("105.00"))
+        self.assertEqual(self.trade.unrealized_pl, Decimal("-105.00"))
+
+    def test_recompute_bulk_after_price_change(self):
+        Stock.objects.filter(pk=self.stock.pk).update(current_price=Decimal("120.00"))
+        self.assertEqual(Trade.recompute_bulk(Trade.objects.filter(stock=self.stock)), 1)
+        trade = Trade.objects.get(pk=self.trade.pk)
+        self.assertEqual(trade.rate_difference, Decimal("9.50"))
+        self.assertIsNone(trade.loss_recent)
+
+    def test_update_metrics_matches_save(self):
+        expected = Trade.objects.values(
+            "profit_expected", "profit_percent", "loss_expected",
+            "pl_ratio", "rate_difference", "pl_percent", "loss_recent", "unrealized_pl",
+        ).get(pk=self.trade.pk)
+        Trade.objects.filter(pk=self.trade.pk).update(
+            profit_expected=None, profit_percent=None, loss_expected=None,
+            pl_ratio=None, rate_difference=None, pl_percent=None, loss_recent=None, unrealized_pl=None,
+        )
+        Trade.objects.filter(pk=self.trade.pk).update_metrics()
+        actual = Trade.objects.values(*expected.keys()).get(pk=self.trade.pk)
+        self.assertEqual(actual, expected)
+
+    def test_stock_save_refreshes_trades(self):
+        self.stock.current_price = Decimal("120.00")
+        self.stock.save()
+        self.assertEqual(Trade.objects.get(pk=self.trade.pk).unrealized_pl, Decimal("95.00"))
+
+
+class RefreshStockPricesApiTesting(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="trader", password="secret")
+        self.client.force_login(self.user)
+        self.stock = Stock.objects.create(symbol="TEST", name="Test Company", current_price=Decimal("100.00"))
+        self.trade = Trade.objects.create(
+            user=self.user, stock=self.stock, quantity=10,
+            buying_price=Decimal("110.50"), buy_date=date(2026, 1, 1),
+        )
+        # Last refreshed long enough ago to be fetched again
+        Stock.objects.filter(pk=self.stock.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+
+    @mock.patch("App.tasks.afetch_stock_from_psx_bulk", new_callable=mock.AsyncMock)
+    def test_refresh_updates_stock_and_trades(self, fetch_bulk):
+        fetch_bulk.return_value = {
+            "TEST": {"symbol": "TEST", "price": 120, "change": 20, "change_percent": 20,
+                     "volume": 1000, "high": 121, "low": 99},
+        }
+        response = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["updated"], 1)
+        self.assertEqual(response.json()["stocks"][0]["current_price"], 120.0)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.current_price, Decimal("120.00"))
+        self.assertEqual(Trade.objects.get(pk=self.trade.pk).rate_difference, Decimal("9.50"))
+
+    @mock.patch("App.tasks.afetch_stock_from_psx_bulk", new_callable=mock.AsyncMock, return_value={})
+    def test_refresh_reports_missing_data(self, fetch_bulk):
+        response = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST"})
+
+        self.assertEqual(response.json()["updated"], 0)
+        self.assertEqual(response.json()["errors"][0]["symbol"], "TEST")
+
+    @mock.patch("App.tasks.afetch_stock_from_psx_bulk", new_callable=mock.AsyncMock)
+    def test_refresh_skips_recently_refreshed(self, fetch_bulk):
+        Stock.objects.filter(pk=self.stock.pk).update(updated_at=timezone.now())
+        response = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST,test"})
+
+        self.assertEqual(response.json()["updated"], 0)
+        self.assertEqual(response.json()["skipped"], [{"id": self.stock.pk, "symbol": "TEST"}])
+        # The stored price is still returned, so the page keeps showing it
+        self.assertEqual(response.json()["stocks"][0]["current_price"], 100.0)
+
+    @mock.patch("App.tasks.afetch_stock_from_psx_bulk", new_callable=mock.AsyncMock)
+    def test_page_polls_30_seconds_apart_both_refresh(self, fetch_bulk):
+        fetch_bulk.return_value = {"TEST": {"symbol": "TEST", "price": 120}}
+        first = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST"})
+
+        fetch_bulk.return_value = {"TEST": {"symbol": "TEST", "price": 125}}
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(seconds=30)):
+            second = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST"})
+
+        self.assertEqual((first.json()["updated"], second.json()["updated"]), (1, 1))
+        self.assertEqual(second.json()["stocks"][0]["current_price"], 125.0)
+
+    @mock.patch("App.services._fetch_many", new_callable=mock.AsyncMock)
+    def test_polls_go_past_the_quote_cache(self, fetch_many):
+        cache.clear()
+        fetch_many.return_value = {"TEST": {"symbol": "TEST", "price": 101}}
+        self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST"})
+
+        # Next page poll: the quote from the first poll is still in the 30 s cache
+        fetch_many.return_value = {"TEST": {"symbol": "TEST", "price": 102}}
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(seconds=30)):
+            second = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST"})
+
+        self.assertEqual(fetch_many.await_count, 2)
+        self.assertEqual(second.json()["stocks"][0]["current_price"], 102.0)
+
+    @mock.patch("App.tasks.connections")  # Keep the test's own DB connection open
+    @mock.patch("App.tasks._EXECUTOR")
+    @mock.patch("App.tasks.afetch_stock_from_psx_bulk", new_callable=mock.AsyncMock)
+    def test_background_refresh_reports_status(self, fetch_bulk, executor, connections):
+        fetch_bulk.return_value = {"TEST": {"symbol": "TEST", "price": 120}}
+        response = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST", "background": "true"})
+        self.assertEqual(response.status_code, 202)
+        status_url = reverse("refresh_stock_prices_status", args=[response.json()["task_id"]])
+        self.assertEqual(self.client.get(status_url).json()["status"], "pending")
+
+        # A second request for the same stocks joins the pending task
+        again = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST", "background": "true"})
+        self.assertEqual(again.json()["task_id"], response.json()["task_id"])
+        self.assertEqual(executor.submit.call_count, 1)
+
+        # Run the executor's work here instead
+        work, *args = executor.submit.call_args.args
+        work(*args)
+
+        status = self.client.get(status_url).json()
+        self.assertEqual((status["status"], status["updated"]), ("done", 1))
+        self.assertEqual(Trade.objects.get(pk=self.trade.pk).rate_difference, Decimal("9.50"))
+
+    @mock.patch("App.tasks._PENDING", new_callable=lambda: threading.BoundedSemaphore(1))
+    @mock.patch("App.tasks._EXECUTOR")
+    def test_background_refresh_refused_when_queue_is_full(self, executor, pending):
+        pending.acquire()  # The only slot is taken by another refresh
+        response = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST", "background": "true"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+        executor.submit.assert_not_called()
+
+    @mock.patch("App.tasks.afetch_stock_from_psx_bulk", new_callable=mock.AsyncMock)
+    def test_bad_quote_does_not_block_good_ones(self, fetch_bulk):
+        bad = Stock.objects.create(symbol="BAD", name="Bad Company", current_price=Decimal("5.00"))
+        Stock.objects.filter(pk=bad.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+        fetch_bulk.return_value = {
+            "TEST": {"symbol": "TEST", "price": 120, "change_percent": 20},
+            "BAD": {"symbol": "BAD", "price": 6, "change_percent": 123456.5},  # Too many digits for the column
+        }
+        response = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST,BAD"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s["symbol"] for s in response.json()["stocks"]], ["TEST"])
+        self.assertEqual(response.json()["errors"][0]["symbol"], "BAD")
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).current_price, Decimal("120.00"))
+        self.assertEqual(Stock.objects.get(pk=bad.pk).current_price, Decimal("5.00"))
+
+    @mock.patch("App.tasks.afetch_stock_from_psx_bulk", new_callable=mock.AsyncMock)
+    def test_float_quotes_are_rounded_not_rejected(self, fetch_bulk):
+        fetch_bulk.return_value = {
+            "TEST": {"symbol": "TEST", "price": 546.78, "change": 0.28, "change_percent": 0.051234,
+                     "volume": 1200.0, "high": 540.0, "low": 530.125},
+        }
+        response = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST", "fresh": "true"})
+
+        self.assertEqual((response.json()["updated"], response.json()["errors"]), (1, []))
+        stock = Stock.objects.get(pk=self.stock.pk)
+        self.assertEqual(
+            (stock.current_price, stock.change, stock.change_percent, stock.high, stock.low),
+            (Decimal("546.78"), Decimal("0.28"), Decimal("0.05"), Decimal("540.00"), Decimal("530.13")),
+        )
+
+    def test_refresh_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse("refresh_stock_prices"), {"symbols": "TEST"})
+
+        self.assertEqual(response.status_code, 302)
+
+
+class TradeFormTesting(TestCase):
+    def test_stock_choices_refresh_after_new_stock(self):
+        Stock.objects.create(symbol="BBB", name="B Company")
+        self.assertIn("BBB", str(TradeForm()["stock"]))
+
+        Stock.objects.create(symbol="AAA", name="A Company")
+        labels = [label for value, label in TradeForm().fields["stock"].choices]
+        self.assertEqual(labels[1:], ["AAA", "BBB"])
+
+
+class PortfolioDashboardTesting(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="trader", password="secret")
+        self.client.force_login(self.user)
+        priced = Stock.objects.create(symbol="AAA", name="A Company", current_price=Decimal("120.00"))
+        unpriced = Stock.objects.create(symbol="BBB", name="B Company")
+        Trade.objects.create(user=self.user, stock=priced, quantity=10,
+                             buying_price=Decimal("100.00"), buy_date=date(2026, 1, 1))
+        Trade.objects.create(user=self.user, stock=unpriced, quantity=5,
+                             buying_price=Decimal("50.00"), buy_date=date(2026, 1, 2))
+
+    def test_totals(self):
+        response = self.client.get(reverse("portfolio_dashboard"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_cost"], Decimal("1250.00"))
+        self.assertEqual(response.context["total_value"], Decimal("1200.00"))
+        self.assertEqual(response.context["unrealized_pl"], Decimal("-50.00"))
+        self.assertEqual(response.context["pl_percentage"], Decimal("-4.00"))
+        self.assertEqual(response.context["active_trades"], 2)
+
+    def test_query_count_does_not_grow_with_trades(self):
+        stock = Stock.objects.get(symbol="AAA")
+        Trade.objects.bulk_create([
+            Trade(user=self.user, stock=stock, quantity=1, buying_price=Decimal("1.00"), buy_date=date(2026, 2, 1))
+            for _ in range(50)
+        ])
+
+        # session + user, ETag, totals aggregate, holdings list
+        for sort in ("symbol", "date", "profit", "loss"):
+            with self.assertNumQueries(5):
+                self.client.get(reverse("portfolio_dashboard"), {"sort": sort})
+
+    def test_unchanged_portfolio_returns_not_modified(self):
+        etag = self.client.get(reverse("portfolio_dashboard"))["ETag"]
+        self.assertEqual(self.client.get(reverse("portfolio_dashboard"), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Stock.objects.filter(symbol="AAA").update(updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get(reverse("portfolio_dashboard"), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_sort_by_profit_and_loss(self):
+        loser = Stock.objects.create(symbol="CCC", name="C Company", current_price=Decimal("10.00"))
+        Trade.objects.create(user=self.user, stock=loser, quantity=1,
+                             buying_price=Decimal("20.00"), buy_date=date(2026, 1, 3))
+
+        profit = self.client.get(reverse("portfolio_dashboard"), {"sort": "profit"})
+        loss = self.client.get(reverse("portfolio_dashboard"), {"sort": "loss"})
+
+        self.assertEqual([t.stock.symbol for t in profit.context["holdings"]][0], "AAA")
+        self.assertEqual([t.stock.symbol for t in loss.context["holdings"]], ["CCC", "AAA", "BBB"])
+
+    def test_holdings_use_db_values(self):
+        holdings = {t.stock.symbol: t for t in self.client.get(reverse("portfolio_dashboard")).context["holdings"]}
+
+        self.assertEqual(holdings["AAA"].total_cost, Decimal("1000.00"))
+        self.assertEqual(holdings["AAA"].current_value, Decimal("1200.00"))
+        self.assertEqual(holdings["AAA"].unrealized_pl, Decimal("200.00"))
+        self.assertIsNone(holdings["BBB"].current_value)
+        self.assertIsNone(holdings["BBB"].unrealized_pl)
+
+
+class FastPaginatorTesting(TestCase):
+    def test_pages_match_ordering(self):
+        for i in range(7):
+            Stock.objects.create(symbol=f"S{i}", name=f"Stock {i}")
+        paginator = FastPaginator(Stock.objects.order_by("-symbol"), 3)
+
+        self.assertEqual(paginator.num_pages, 3)
+        self.assertEqual([s.symbol for s in paginator.page(1)], ["S6", "S5", "S4"])
+        self.assertEqual([s.symbol for s in paginator.page(3)], ["S0"])
+
+    def test_caching_paginator_reuses_count(self):
+        Stock.objects.create(symbol="AAA", name="A Company")
+        stocks = Stock.objects.filter(symbol__startswith="A").order_by("symbol")
+        self.assertEqual(CachingPaginator(stocks, 25).count, 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(CachingPaginator(stocks, 25).count, 1)
+
+
+class PsxServiceTesting(TestCase):
+    def test_invalid_payload_is_no_data(self):
+        client = mock.Mock(get=mock.AsyncMock(return_value=httpx.Response(200, content=b"[1, 2]")))
+        self.assertIsNone(async_to_sync(services.fetch_stock_from_psx_async)(client, "AAA"))
+
+    @mock.patch("App.services.fetch_stock_from_psx_async", new_callable=mock.AsyncMock)
+    def test_one_failing_symbol_does_not_fail_the_batch(self, fetch_async):
+        fetch_async.side_effect = [{"symbol": "AAA", "price": 1}, ValueError("boom")]
+        results = async_to_sync(services._fetch_many)(["AAA", "BBB"])
+
+        self.assertEqual(results, {"AAA": {"symbol": "AAA", "price": 1}, "BBB": None})
+
+
+class CircuitBreakerTesting(TestCase):
+    def setUp(self):
+        self.breaker = services.CircuitBreaker(threshold=3, cooldown=30)
+        patcher = mock.patch.object(services, "_BREAKER", self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_threshold_failures(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open())
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open())
+
+    @mock.patch("App.services._SESSION")
+    def test_open_breaker_skips_the_call(self, session):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+        self.assertIsNone(services._fetch_stock("AAA"))
+        session.get.assert_not_called()
+
+    def test_success_resets(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.breaker.record_success()
+
+        self.assertFalse(self.breaker.is_open())
+        self.assertEqual(self.breaker.failures, 0)
+
+    @mock.patch("App.services.time.monotonic", return_value=1000.0)
+    def test_retry_after_opens_for_that_long(self, monotonic):
+        services._record_bad_status(httpx.Response(429, headers={"Retry-After": "10"}))
+        self.assertTrue(self.breaker.is_open())
+
+        monotonic.return_value = 1010.0
+        self.assertFalse(self.breaker.is_open())
+
+    @mock.patch("App.services.time.monotonic", return_value=1000.0)
+    def test_retry_after_is_capped(self, monotonic):
+        services._record_bad_status(httpx.Response(429, headers={"Retry-After": "3600"}))
+
+        monotonic.return_value = 1000.0 + services.MAX_RETRY_AFTER
+        self.assertFalse(self.breaker.is_open())
+
+    def test_session_leaves_bad_statuses_to_the_breaker(self):
+        retry = services._SESSION.get_adapter(services.PSX_BASE_URL).max_retries
+        self.assertEqual(retry.status, 0)
+        self.assertFalse(retry.respect_retry_after_header)
+
+    def test_not_found_is_not_counted(self):
+        services._record_bad_status(httpx.Response(404))
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_non_numeric_retry_after_is_ignored(self):
+        response = httpx.Response(429, headers={"Retry-After": "soon"})
+        self.assertIsNone(services._retry_after(response))
+
+        services._record_bad_status(response)
+        self.assertEqual(self.breaker.failures, 1)
+        self.assertFalse(self.breaker.is_open())  # Counted, but below the threshold
+
+
+class QuoteCacheTesting(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.quote = {"symbol": "AAA", "price": 10}
+
+    @mock.patch("App.services._fetch_stock")
+    def test_cache_hit_skips_the_api(self, fetch):
+        cache.set("psx:AAA", self.quote)
+
+        self.assertEqual(services.fetch_stock_from_psx("aaa"), self.quote)
+        fetch.assert_not_called()
+
+    @mock.patch("App.services._fetch_stock", return_value={"symbol": "AAA", "price": 11})
+    def test_refresh_bypasses_the_cache(self, fetch):
+        cache.set("psx:AAA", self.quote)
+
+        self.assertEqual(services.fetch_stock_from_psx("AAA", refresh=True)["price"], 11)
+        self.assertEqual(cache.get("psx:AAA")["price"], 11)
+
+    @mock.patch("App.services._fetch_stock", return_value=None)
+    def test_failed_fetch_is_not_cached(self, fetch):
+        services.fetch_stock_from_psx("AAA")
+        services.fetch_stock_from_psx("AAA")
+
+        self.assertEqual(fetch.call_count, 2)
+        self.assertIsNone(cache.get("psx:AAA"))
+
+    @mock.patch("App.services._fetch_many", new_callable=mock.AsyncMock)
+    def test_bulk_fetches_only_misses_once_in_caller_order(self, fetch_many):
+        cache.set("psx:BBB", {"symbol": "BBB", "price": 2})
+        fetch_many.return_value = {"CCC": {"symbol": "CCC", "price": 3}, "AAA": None}
+
+        results = async_to_sync(services.afetch_stock_from_psx_bulk)(["CCC", "BBB", "AAA", "CCC", ""])
+
+        fetch_many.assert_awaited_once_with(["CCC", "AAA"])
+        self.assertEqual(list(results), ["CCC", "BBB", "AAA"])
+        self.assertEqual(results["BBB"]["price"], 2)
+        self.assertIsNone(results["AAA"])
@@ -0,0 +1,15 @@
+# -------------------------------------------------------#
+#-------------------- urls_stocks.py --------------------#
+# -------------------------------------------------------#
+# Routes mounted under "stocks/" (see urls.py)
+from django.urls import path
+from .views import *
+
+urlpatterns = [
+    path("", stock_list_view, name="stock_list"),
+    path("add/", stock_create_view, name="stock_add"),
+    path("fetch/", fetch_stock_price_ajax, name="fetch_stock_price"),  # Must be before <int:pk>/
+    path("<int:pk>/", stock_detail_view, name="stock_detail"),
+    path("<int:pk>/edit/", stock_update_view, name="stock_update"),
+    path("<int:pk>/delete/", stock_delete_view, name="stock_delete"),
+]
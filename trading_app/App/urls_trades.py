@@ -0,0 +1,13 @@
+# -------------------------------------------------------#
+#-------------------- urls_trades.py --------------------#
+# -------------------------------------------------------#
+# Routes mounted under "trades/" (see urls.py)
+from django.urls import path
+from .views import *
+
+urlpatterns = [
+    path("", trade_list_view, name="trade_list"),
+    path("add/", trade_create_view, name="trade_add"),
+    path("<int:pk>/edit/", trade_update_view, name="trade_update"),
+    path("<int:pk>/delete/", trade_delete_view, name="trade_delete"),
+]
@@ -4,16 +4,41 @@
 import decimal
 from django.shortcuts import render, redirect, get_object_or_404  # Import shortcut functions for rendering, redirecting and object retrieval
 from django.contrib.auth.decorators import login_required  # Decorator to require login on certain views
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger  # Imports for pagination handling
+from django.core.paginator import EmptyPage, PageNotAnInteger  # Imports for pagination handling
 
 from .models import Stock, Trade  # Import Stock and Trade database models
 from .forms import StockForm, TradeForm  # Import ModelForms for stocks and trades
+from .paginators import CachingPaginator  # Paginator that skips rows by primary key and caches the count
 
 from .services import fetch_stock_from_psx
-from django.http import JsonResponse
+from .tasks import PRICE_FIELDS, refresh_stocks, start_refresh_task, get_task_status
+from .responses import OrjsonResponse  # JsonResponse, but encoded with orjson
 
-from django.db.models import F, ExpressionWrapper, DecimalField
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+from datetime import timedelta
+
+from django.utils import timezone
+from django.db.models import F, ExpressionWrapper, DecimalField, Sum, Count, Max
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
 from django.db.models.functions import Coalesce
+
+# Stocks refreshed less than this many seconds ago are not fetched again. Kept well below
+# the pages' 30 s auto-refresh interval, so each poll of a page still gets new prices
+REFRESH_MIN_AGE = 20
+
+# Dashboard ?sort= value -> ordering, built once at import instead of per request.
+# nulls_last is emulated on MySQL (an extra IS NULL sort key), so the profit/loss sorts are
+# done over the user's trades rather than read in index order
+SORT_MAP = {
+    "symbol": ["stock__symbol"],  # Sort by symbol
+    "date": ["-buy_date"],  # Sort by buy date descending
+    "profit": [F("unrealized_pl").desc(nulls_last=True)],  # Highest profit first, stocks without a price last
+    "loss": [F("unrealized_pl").asc(nulls_last=True)],  # Biggest loss first, stocks without a price last
+}
 # ------------------------ HOME ------------------------
 
 def home_view(request):
@@ -47,7 +72,7 @@ def stock_update_view(request, pk):
     if request.method == "POST":
         form = StockForm(request.POST, instance=stock)  # Bind form to POST data with existing stock instance
         if form.is_valid():  # If the form is valid
-            form.save()  # Save the updated stock to the database
+            form.save()  # Save the updated stock (Stock.save() also refreshes its trades' P/L)
             return redirect("portfolio_dashboard")  # After saving, redirect to portfolio dashboard
     else:
         form = StockForm(instance=stock)  # For GET: create form with existing stock data
@@ -67,15 +92,28 @@ def stock_delete_view(request, pk):
         return redirect("portfolio_dashboard")  # Redirect to portfolio dashboard after deletion
     return render(request, "App/stocks/stock_confirm_delete.html", {"stock": stock})  # Show confirmation page
 
+def _stock_list_etag(request):
+    """
+    Changes whenever a stock is added, edited, refreshed or deleted.
+    """
+    state = Stock.objects.aggregate(count=Count("id"), last=Max("updated_at"))
+    return f"{state['count']}-{state['last']}"
+
+
 @login_required  # User must be logged in to access
+@cache_control(private=True, no_cache=True)  # Browser keeps the page but must revalidate it
+@vary_on_cookie  # Page is per user
+@condition(etag_func=_stock_list_etag)  # Unchanged stocks -> 304, page isn't rendered
 def stock_list_view(request):
     """
     Display the list of all stocks with pagination.
     Note: User must be authenticated to access this view.
     """
-    stocks_list = Stock.objects.all().order_by('symbol')  # Get all stocks ordered by symbol
+    stocks_list = Stock.objects.only(  # Only the columns the list template shows (skips targets, RSI, etc.)
+        'symbol', 'name', 'current_price', 'change', 'change_percent', 'volume', 'high', 'low'
+    ).order_by('symbol')  # Get all stocks ordered by symbol
 
-    paginator = Paginator(stocks_list, 25)  # Set up paginator (25 stocks per page)
+    paginator = CachingPaginator(stocks_list, 25)  # Set up paginator (25 stocks per page)
     page = request.GET.get('page')  # Get page number from request querystring
     try:
         stocks = paginator.page(page)  # Try to get stocks for requested page
@@ -115,9 +153,14 @@ def trade_list_view(request):
     """
     Display a list of trades belonging to the logged-in user with pagination.
     """
-    trades_list = Trade.objects.filter(user=request.user).select_related('stock').order_by('-created_at')  # Get user's trades, newest first
+    trades_list = (
+        Trade.objects.filter(user=request.user)
+        .select_related(None).select_related('stock')  # Drop the manager's user join, the template never shows it
+        .only('quantity', 'buying_price', 'buy_date', 'stock__symbol')  # Only the columns the list template shows
+        .order_by('-created_at')  # Get user's trades, newest first
+    )
 
-    paginator = Paginator(trades_list, 25)  # Paginate 25 trades per page
+    paginator = CachingPaginator(trades_list, 25)  # Paginate 25 trades per page
     page = request.GET.get('page')  # Get page number
     try:
         trades = paginator.page(page)  # Get trades for page #page
@@ -169,17 +212,31 @@ def trade_delete_view(request, pk):
 
 # ------------------------ DASHBOARD ------------------------
 
+def _dashboard_etag(request):
+    """
+    Changes whenever one of the user's trades, or the price of a stock
+    they hold, changes.
+    """
+    state = Trade.objects.filter(user=request.user).aggregate(
+        count=Count("id"), trades=Max("updated_at"), prices=Max("stock__updated_at"),
+    )
+    return f"{state['count']}-{state['trades']}-{state['prices']}"
+
+
 @login_required  # Dashboard requires login
+@cache_control(private=True, no_cache=True)  # Browser keeps the page but must revalidate it
+@vary_on_cookie  # Page is per user
+@condition(etag_func=_dashboard_etag)  # Unchanged portfolio -> 304, page isn't rendered
 def portfolio_dashboard(request):
     """
     Show the user's portfolio summary/dashboard.
-    Uses model properties for calculations (DRY principle).
+    Per-trade values and portfolio totals are calculated by the database.
     Only logged-in users can view their portfolio dashboard.
     """
     trades = (
         Trade.objects
         .filter(user=request.user)
-        .select_related("stock")
+        .with_values()  # total_cost / current_value computed by the DB
     )
 
 
@@ -191,53 +248,44 @@ def portfolio_dashboard(request):
 
     # ---------- SORT ----------
     sort_by = request.GET.get('sort', 'symbol')  # Get sort type - default to 'symbol'
-    if sort_by == "symbol":
-        trades = trades.order_by("stock__symbol")  # Sort by symbol
-
-    elif sort_by == "date":
-        trades = trades.order_by("-buy_date")  # Sort by buy date descending
-
-    elif sort_by == 'profit':
-        trades = trades.annotate(
-            pl = ExpressionWrapper(
-                (F("quantity") * Coalesce(F("stock__current_price"), decimal.Decimal(0))) - 
-                (F("quantity") * F("buying_price")),
-                output_field=DecimalField(max_digits=15, decimal_places=2)
-            )
-        ).order_by(-"pl")
-
-    elif sort_by == 'loss':
-        trades = trades.annotate(
-            pl=ExpressionWrapper(
-                (F("quantity") * F("stock__current_price")) -
-                (F("quantity") * F("buying_price")),
-                output_field=DecimalField(max_digits=15, decimal_places=2)
-            )
-        ).order_by("pl")
+    trades = trades.order_by(*SORT_MAP.get(sort_by, SORT_MAP["symbol"]))  # Unknown values fall back to symbol
+
+    # Make sure the final queryset still joins the stock the template reads for every row
+    trades = trades.select_related("stock")
 
     # ---------- TOTALS ----------
-    total_cost = sum(
-        t.quantity *t.buying_price 
-        for t in trades
-    )  # Total purchase cost
-
-    total_value = sum(
-        t.quantity * t.stock.current_price 
-        for t in trades 
-        if t.stock.current_price
+    # Both totals come back from one aggregate query; no trade is loaded into Python for them
+    money = DecimalField(max_digits=15, decimal_places=2)
+    totals = trades.aggregate(
+        total_cost=Coalesce(  # Total purchase cost
+            Sum(ExpressionWrapper(F("quantity") * F("buying_price"), output_field=money)),
+            decimal.Decimal(0), output_field=money,
+        ),
+        total_value=Coalesce(  # Current market value (stocks without a price count as 0)
+            Sum(ExpressionWrapper(
+                F("quantity") * Coalesce(F("stock__current_price"), decimal.Decimal(0)), output_field=money
+            )),
+            decimal.Decimal(0), output_field=money,
+        ),
+        active_trades=Count("id"),  # Counted here so no separate COUNT(*) query is needed
     )
-  
+    total_cost = totals["total_cost"]
+    total_value = totals["total_value"]
 
     total_unrealized_pl = total_value - total_cost  # Total profit/loss not yet realized
-    pl_percentage = round((total_unrealized_pl / total_cost) * 100, 2) if total_cost else 0  # Profit/loss % for portfolio
+    # Profit/loss % for portfolio; stays Decimal throughout (multiply first, then one division)
+    pl_percentage = round(total_unrealized_pl * 100 / total_cost, 2) if total_cost else decimal.Decimal(0)
+
+    # Run the holdings query exactly once here; the template only reads the list
+    holdings = list(trades)
 
     context = {  # Prepare all data for rendering the dashboard template
-        "holdings": trades,     # All holdings/trades for the user
+        "holdings": holdings,     # All holdings/trades for the user
         "total_cost": total_cost,      # Total invested
         "total_value": total_value,    # Current portfolio value
         "unrealized_pl": total_unrealized_pl,  # Unrealized profit/loss total
         "pl_percentage": pl_percentage,   # Portfolio PL as percent
-        "active_trades": trades.count(),  # Number of active trades/holdings
+        "active_trades": totals["active_trades"],  # Number of active trades/holdings
         "user_name": request.user.username,   # Current username
         "sort_by": sort_by,                  # What are we sorting by
         "stock_filter": stock_filter or "",   # What are we filtering by
@@ -280,28 +328,35 @@ def fetch_stock_price_ajax(request):
     symbol = request.GET.get("symbol", "").strip().upper()
 
     if not symbol:
-        return JsonResponse({"error": "Symbol is required"}, status=400)
+        return OrjsonResponse({"error": "Symbol is required"}, status=400)
 
     data = fetch_stock_from_psx(symbol)
 
     if not data or data.get("price") is None:
-        return JsonResponse(
+        return OrjsonResponse(
             {"error": f"No data found for symbol {symbol}"},
             status=404
         )
 
-    return JsonResponse({
+    return OrjsonResponse({
         "symbol" : data["symbol"],
         "name": data["name"],   # ✅ COMPANY NAME
-        "price": float(data["price"]),
-        "high": float(data["high"]) if data.get("high") else "",
-        "low": float(data["low"]) if data.get("low") else "",
+        "price": data["price"],
+        "high": data["high"] if data.get("high") else "",
+        "low": data["low"] if data.get("low") else "",
         "volume": int(data["volume"]) if data.get("volume") else "",
     })
 
 
-@login_required
-def refresh_stock_prices_api(request):
+def _is_authenticated(request):
+    """
+    request.user is loaded lazily from the session (a DB query), so async views
+    must resolve it through sync_to_async.
+    """
+    return request.user.is_authenticated
+
+
+async def refresh_stock_prices_api(request):
     """
     API endpoint to refresh stock prices for multiple stocks at once.
     Accepts stock IDs or symbols via query parameters.
@@ -311,14 +366,27 @@ def refresh_stock_prices_api(request):
     - /api/stocks/refresh/?ids=1,2,3 (refresh by stock IDs)
     - /api/stocks/refresh/?symbols=GAL,CIT,PSO (refresh by symbols)
     - /api/stocks/refresh/?all=true (refresh all stocks - use with caution)
+    - add &fresh=true to also refetch stocks refreshed in the last REFRESH_MIN_AGE seconds
+    - add &background=true to get 202 + a task_id at once and poll
+      /api/stocks/refresh/status/<task_id>/ for the result
+
+    Stocks refreshed in the last REFRESH_MIN_AGE seconds are not fetched again
+    (unless fresh=true); their stored prices are returned in "stocks" and
+    they are listed under "skipped". "updated" counts only the fetched ones.
     """
+    # Same check as @login_required, which only wraps sync views on this Django version
+    if not await sync_to_async(_is_authenticated)(request):
+        return redirect_to_login(request.get_full_path())
+
     if request.method != "GET":
-        return JsonResponse({"error": "Method not allowed"}, status=405)
+        return OrjsonResponse({"error": "Method not allowed"}, status=405)
     
     # Get parameters
     stock_ids = request.GET.get("ids", "").strip()
     symbols = request.GET.get("symbols", "").strip()
     refresh_all = request.GET.get("all", "").lower() == "true"
+    fresh = request.GET.get("fresh", "").lower() == "true"
+    background = request.GET.get("background", "").lower() == "true"
     
     stocks_to_refresh = []
     
@@ -329,64 +397,68 @@ def refresh_stock_prices_api(request):
     elif stock_ids:
         # Refresh by IDs
         try:
-            id_list = [int(id.strip()) for id in stock_ids.split(",") if id.strip()]
+            id_list = list({int(id.strip()) for id in stock_ids.split(",") if id.strip()})  # Dedupe repeated IDs
             stocks_to_refresh = Stock.objects.filter(pk__in=id_list)
         except ValueError:
-            return JsonResponse({"error": "Invalid stock IDs format"}, status=400)
+            return OrjsonResponse({"error": "Invalid stock IDs format"}, status=400)
     elif symbols:
         # Refresh by symbols
-        symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+        symbol_list = list({s.strip().upper() for s in symbols.split(",") if s.strip()})  # Dedupe repeated symbols
         stocks_to_refresh = Stock.objects.filter(symbol__in=symbol_list)
     else:
-        return JsonResponse({"error": "Please provide 'ids', 'symbols', or 'all=true' parameter"}, status=400)
-    
-    if not stocks_to_refresh.exists():
-        return JsonResponse({"error": "No stocks found"}, status=404)
-    
-    # Fetch and update prices for each stock
-    updated_stocks = []
-    errors = []
+        return OrjsonResponse({"error": "Please provide 'ids', 'symbols', or 'all=true' parameter"}, status=400)
     
-    for stock in stocks_to_refresh:
-        try:
-            # Fetch latest data from API
-            market_data = fetch_stock_from_psx(stock.symbol)
-            
-            if market_data and market_data.get("price") is not None:
-                # Update stock in database
-                stock.current_price = market_data.get("price")
-                stock.change = market_data.get("change")
-                stock.change_percent = market_data.get("change_percent")
-                stock.volume = market_data.get("volume")
-                stock.high = market_data.get("high")
-                stock.low = market_data.get("low")
-                stock.save()
-                
-                # Add to response
-                updated_stocks.append({
-                    "id": stock.pk,
-                    "symbol": stock.symbol,
-                    "current_price": float(stock.current_price) if stock.current_price else None,
-                    "change": float(stock.change) if stock.change else None,
-                    "change_percent": float(stock.change_percent) if stock.change_percent else None,
-                    "volume": int(stock.volume) if stock.volume else None,
-                    "high": float(stock.high) if stock.high else None,
-                    "low": float(stock.low) if stock.low else None,
-                })
+    # Plain (pk, symbol, updated_at) tuples are all that's needed to fetch; no model instances
+    # The stored prices come along so recently refreshed stocks can be answered without a fetch
+    rows = await sync_to_async(list)(stocks_to_refresh.values("pk", "symbol", "updated_at", *PRICE_FIELDS))
+    if not rows:
+        return OrjsonResponse({"error": "No stocks found"}, status=404)
+
+    # Don't fetch stocks another request refreshed moments ago; their stored prices are current,
+    # so they are returned in "stocks" like the refreshed ones (and listed under "skipped")
+    skipped_stocks = []
+    if not fresh:
+        cutoff = timezone.now() - timedelta(seconds=REFRESH_MIN_AGE)
+        due = []
+        for row in rows:
+            if row["updated_at"] and row["updated_at"] > cutoff:
+                skipped_stocks.append({"id": row["pk"], "symbol": row["symbol"],
+                                       **{name: row[name] for name in PRICE_FIELDS}})
             else:
-                errors.append({
-                    "symbol": stock.symbol,
-                    "error": "No data available from API"
-                })
-        except Exception as e:
-            errors.append({
-                "symbol": stock.symbol,
-                "error": str(e)
-            })
+                due.append(row)
+        rows = due
+    rows = [(row["pk"], row["symbol"]) for row in rows]
+    skipped = [{"id": stock["id"], "symbol": stock["symbol"]} for stock in skipped_stocks]
+
+    if background:
+        # Answer now; the fetch and the writes happen in a background thread
+        task_id = await sync_to_async(start_refresh_task)(rows, skipped_stocks)
+        if task_id is None:
+            # Too many background refreshes already queued in this worker
+            response = OrjsonResponse({"success": False, "error": "Too many refreshes in progress"}, status=503)
+            response["Retry-After"] = "5"
+            return response
+        return OrjsonResponse({"task_id": task_id, "stocks": skipped_stocks, "skipped": skipped}, status=202)
+
+    updated_stocks, errors = await refresh_stocks(rows)
     
-    return JsonResponse({
+    return OrjsonResponse({
         "success": True,
         "updated": len(updated_stocks),
-        "stocks": updated_stocks,
+        "stocks": updated_stocks + skipped_stocks,
+        "skipped": skipped,
         "errors": errors
     })
+
+
+@login_required
+def refresh_stock_prices_status_api(request, task_id):
+    """
+    Status of a background refresh started with ?background=true.
+    "status" is "pending", "done" (with the same fields as the normal
+    refresh response) or "failed".
+    """
+    status = get_task_status(task_id)
+    if status is None:
+        return OrjsonResponse({"error": "Unknown or expired task"}, status=404)
+    return OrjsonResponse(status)
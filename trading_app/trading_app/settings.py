@@ -57,8 +57,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'App/templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compile each template once per process instead of on every render
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -100,6 +106,9 @@ DATABASES = {
         'PASSWORD': os.getenv("DB_PASSWORD", "root"),
         'HOST': os.getenv("DB_HOST", "localhost"),
         'PORT': os.getenv("DB_PORT", "3308"),
+        # Keep connections open between requests instead of reconnecting every time
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        'CONN_HEALTH_CHECKS': True,  # Drop a stale persistent connection before reusing it
         'OPTIONS': {
             'charset': 'utf8mb4',
         },
@@ -115,6 +124,21 @@ LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/stocks/'
 LOGOUT_REDIRECT_URL = '/'
 
+
+# Cache
+# "default" stays in process memory (PSX quotes, paginator counts).
+# "tasks" holds background refresh status and must be shared by every worker
+# process, so it lives in the database; its table is created by App migration 0008.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tasks': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'refresh_task_cache',
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -150,3 +174,30 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+# Logging
+# https://docs.djangoproject.com/en/4.2/topics/logging/
+# App log records are written to stderr by a background thread (see App/log_handlers.py)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{levelname} {asctime} {name}: {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'background_console': {
+            'class': 'App.log_handlers.BackgroundStreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'App': {
+            'handlers': ['background_console'],
+            'level': 'INFO',
+        },
+    },
+}